@@ -1,13 +1,26 @@
 #!/usr/bin/env python3
+import os
+import re
+import select
 import serial
 import struct
 import sys
+from collections import deque
 
 FRAME_HEAD = b'\xFD\xFC\xFB\xFA'
 FRAME_END = b'\x04\x03\x02\x01'
+_HEAD_RE = re.compile(re.escape(FRAME_HEAD))
+
+# Precompiled formats so we don't pay the format-string lookup on every frame
+_U_VER = struct.Struct('<HHH')
+_U_PARAMS = struct.Struct('<IIIIII')
+
+# memoryview.cast uses native byte order, so the zero-copy parameter read is
+# only valid on little-endian hosts (the wire format is little-endian)
+_LITTLE_ENDIAN = sys.byteorder == 'little'
 def frame(cmd, value):
-    data_len = struct.pack('<H', len(cmd) + len(value) + 1)
-    return FRAME_HEAD + data_len + cmd + b'\x00' + value + FRAME_END
+    body = cmd + b'\x00' + value
+    return b''.join((FRAME_HEAD, len(body).to_bytes(2, 'little'), body, FRAME_END))
 
 STATUS_SUCCESS = b'\x00\x00'
 
@@ -25,18 +38,55 @@ class Responses:
     PARAMS_READ     = b'\x71\x01'
     SERIAL_READ     = b'\x11\x01'
 
+# Minimum payload length per response word; shorter frames are dropped at
+# dispatch so the handlers don't need individual checks
+_MIN_LEN = {
+    Responses.CONFIG_END:  4,
+    Responses.GET_VERSION: 14,
+    Responses.PARAMS_READ: 4 + 4*6,
+    Responses.SERIAL_READ: 6,
+}
+
 class LD2410s:
+    # How many commands to keep in flight; the sensor buffers at least 2-3
+    MAX_OUTSTANDING = 2
+
     def __init__(self, serial: serial.Serial) -> None:
         self.serial = serial
-        self.buf = b''
-        self.waiting_for_frame = False
+
+        # Fixed receive buffer consumed via offsets: parsing advances _tail
+        # instead of shifting the remaining bytes down, and the live region
+        # only moves (one memmove) when the write position hits the end
+        self._ring = bytearray(8192)
+        self._head = 0       # write position
+        self._tail = 0       # consume position
+        self._scan_from = 0  # offset up to which the ring is known head-free
+
+        # On POSIX, wait for readability with select() and drain the port in
+        # one read instead of blocking inside pyserial. Fall back to blocking
+        # reads where the port has no selectable fd (e.g. Windows).
+        try:
+            self._fd = serial.fileno()
+        except Exception:
+            self._fd = None
+        self.outstanding = 0  # responses we still expect from the sensor
+
+        # The whole startup conversation is static, so queue it up-front and
+        # keep commands in flight instead of stop-and-wait per exchange
+        self._pending = deque((
+            Commands.GET_VERSION,
+            Commands.CONFIG_START,
+            Commands.SERIAL_READ,
+            Commands.PARAMS_READ,
+            Commands.CONFIG_END,
+        ))
 
         self.config_started = False
 
         self.version = None
         self.serial_number = None
-        self._freq_status = None         # parameter 02 (0.5-8Hz, .5 increment)
-        self._freq_distance = None       # parameter 0C (0.5-8Hz, .5 increment)
+        self._freq_status = None         # parameter 02, in 0.5Hz steps (0.5-8Hz)
+        self._freq_distance = None       # parameter 0C, in 0.5Hz steps (0.5-8Hz)
         self._distance_max = None        # parameter 05 (1-16 -> max 11.2m)
         self._distance_min = None        # parameter 0A (0-16 -> max 11.2m)
         self._unattended_delay = None    # parameter 06 (10-120s)
@@ -44,23 +94,23 @@ class LD2410s:
 
     @property
     def freq_status(self):
-        return self._freq_status * 0.1
-    
+        return self._freq_status * 0.5
+
     @freq_status.setter
     def freq_status(self, val: float):
         if val < 0.5 or val > 8:
             raise Exception(f"Value {val} out of range 0.5 - 8")
-        self._freq_status = int(val * 2)/2 # force it to be 0.5 increment
+        self._freq_status = round(val * 2) # snap to the 0.5Hz grid, stored as int
 
     @property
     def freq_distance(self):
-        return self._freq_distance * 0.1
-    
+        return self._freq_distance * 0.5
+
     @freq_distance.setter
     def freq_distance(self, val: float):
         if val < 0.5 or val > 8:
             raise Exception(f"Value {val} out of range 0.5 - 8")
-        self._freq_distance = int(val * 2)/2 # force it to be 0.5 increment
+        self._freq_distance = round(val * 2) # snap to the 0.5Hz grid, stored as int
 
     @property
     def distance_max(self):
@@ -79,114 +129,161 @@ class LD2410s:
         return "fast" if self._response_speed == 10 else "normal"
 
     def done_reading(self) -> bool:
-        return self.get_next_cmd() is None
-
-    # Most commands rely on having config enabled first
-    def with_config(self, cmd: bytes) -> bytes:
-        return Commands.CONFIG_START if not self.config_started else cmd
-
-    def get_next_cmd(self) -> bytes:
-        if not self.version:
-            return Commands.GET_VERSION
-
-        if not self.serial_number:
-            return self.with_config(Commands.SERIAL_READ)
-
-        if not self._freq_status:
-            return self.with_config(Commands.PARAMS_READ)
-
-        # We have fetched all configuration. Exit config mode again
-        if self.config_started:
-            return Commands.CONFIG_END
-
-        return None
+        return not self._pending and not self.outstanding
 
     # Fetch more information. Returns whether more information was requested
     def update(self) -> bool:
-        self.buf += self.serial.read()
-        data = self.unframe()
-        if data:
+        # Keep the sensor's input buffer topped up before waiting on output
+        while self._pending and self.outstanding < self.MAX_OUTSTANDING:
+            self.serial.write(self._pending.popleft())
+            self.outstanding += 1
+
+        if self.done_reading():
+            return False
+
+        # Read straight into the ring; no intermediate bytes object
+        window = self._write_window(4096)
+        if self._fd is not None:
+            r, _, _ = select.select([self._fd], [], [], 0.5)
+            if r:
+                self._head += os.readv(self._fd, (window,))
+        else:
+            # size the read by what's buffered so readinto doesn't block
+            # waiting for a full window; 1 byte keeps the timeout semantics
+            want = min(self.serial.in_waiting or 1, len(window))
+            self._head += self.serial.readinto(window[:want]) or 0
+        # A bulk read may have buffered several frames; drain them all
+        while True:
+            data = self.unframe()
+            if data is None:
+                break
             self.parse(data)
-            self.waiting_for_frame = False
-
-        if not self.waiting_for_frame and not self.done_reading():
-            self.serial.write(self.get_next_cmd())
-            self.waiting_for_frame = True
-
-        return self.waiting_for_frame
-
-    def unframe(self) -> bytes:
-        try:
-            end_idx = self.buf.index(FRAME_END)
-            remainder = self.buf[end_idx+4:]
-            try:
-                start_idx = self.buf.index(FRAME_HEAD)
-                data = self.buf[start_idx+4:end_idx]
-                data_len = struct.unpack('<H', data[0:2])[0]
-                if len(data) != data_len + 2:
-                    print(f"expected length {data_len} but got {len(data)-2}")
-
-                self.buf = remainder
-                return data[2:]
-
-            except Exception as e:
-                # didn't find a FRAME_START marker (should really only happen at the very beginning)
-                self.buf = remainder
-                return None
-        except:
-            # Didn't find a FRAME_END marker
+            if self.outstanding:
+                self.outstanding -= 1
+
+        return not self.done_reading()
+
+    def _write_window(self, size: int) -> memoryview:
+        if self._head + size > len(self._ring):
+            self._compact(size)
+        return memoryview(self._ring)[self._head:self._head+size]
+
+    def _compact(self, needed: int) -> None:
+        # Move the live region back to the front (single memmove per lap
+        # around the buffer, rather than one per parsed frame)
+        live = self._head - self._tail
+        if self._tail:
+            self._ring[:live] = self._ring[self._tail:self._head]
+            self._scan_from = max(0, self._scan_from - self._tail)
+            self._head = live
+            self._tail = 0
+        if live + needed > len(self._ring):
+            # keeps an oversized frame from overflowing; shouldn't happen
+            # with the protocol's 2-byte length field and 4KB reads
+            self._ring.extend(bytes(live + needed - len(self._ring)))
+
+    def unframe(self) -> memoryview:
+        # Resume the head scan where the last one stopped, so noise before a
+        # frame is only ever scanned once
+        m = _HEAD_RE.search(self._ring, max(self._tail, self._scan_from), self._head)
+        if m is None:
+            # No frame head buffered yet; keep the last 3 bytes rescannable
+            # in case a head arrives split across reads, and consume the
+            # noise in front of them
+            self._scan_from = max(self._tail, self._head - 3)
+            self._tail = self._scan_from
             return None
+        start_idx = m.start()
+        self._scan_from = start_idx
 
-    def parse(self, data: bytes) -> None:
-        resp_word = data[0:2]
-        match resp_word:
-            case Responses.CONFIG_START:
-                self.config_started = True
-                return
-
-            case Responses.CONFIG_END:
-                if len(data) < 4: raise Exception("Malformed response")
-                if data[2:4] == STATUS_SUCCESS:
-                    self.config_started = False
-                return
-
-            case Responses.GET_VERSION:
-                if len(data) < 14: raise Exception("Malformed version response")
-                equipment_type = data[2:6]
-                version_type = data[6:8]
-                major, minor, patch = struct.unpack('<HHH', data[8:14])
-                self.version = f"{major}.{minor}.{patch}"
-                return
-
-            case Responses.PARAMS_READ:
-                if data[2:4] == STATUS_SUCCESS:
-                    # we expect 6 responses of 4 bytes each
-                    if len(data) < (4+4*6): raise Exception("Malformed parameter response")
-                    (
-                        self._freq_status,
-                        self._freq_distance,
-                        self._distance_max,
-                        self._distance_min,
-                        self._unattended_delay,
-                        self._response_speed
-                    ) = struct.unpack('<IIIIII', data[4:])
-                return
+        # The length field tells us where the frame ends, no need to scan for
+        # FRAME_END. Wait until the whole frame is buffered.
+        if self._head < start_idx + 6:
+            return None
+        data_len = int.from_bytes(self._ring[start_idx+4:start_idx+6], 'little')
+        end_idx = start_idx + 6 + data_len
+        if self._head < end_idx + 4:
+            return None
 
-            case Responses.SERIAL_READ:
-                if len(data) < 4: raise Exception("Malformed response")
-                if data[2:4] == STATUS_SUCCESS:
-                    serial_len = struct.unpack('<H', data[4:6])[0]
-                    self.serial_number = struct.unpack(f'<{serial_len}s', data[6:6+serial_len])[0].decode('ascii')
-                return
+        if not self._ring.startswith(FRAME_END, end_idx):
+            # Corrupt length field or noise; skip this head and resync
+            self._tail = start_idx + 4
+            self._scan_from = self._tail
+            return None
 
-            case _:
-                print(f"Received unknown response 0x{resp_word.hex()}")
+        data = bytes(self._ring[start_idx+6:end_idx])
+        self._tail = end_idx + 4
+        self._scan_from = self._tail
+        if self._tail == self._head:
+            # fully drained; restart at the front for free
+            self._head = self._tail = self._scan_from = 0
+        # A view keeps the sub-slices taken in parse() zero-copy
+        return memoryview(data)
+
+    def parse(self, data: memoryview) -> None:
+        resp_word = bytes(data[0:2])
+        handler = self._HANDLERS.get(resp_word)
+        if handler is None:
+            print(f"Received unknown response 0x{resp_word.hex()}")
+            return
+        if len(data) < _MIN_LEN.get(resp_word, 0):
+            # Bad sensor data isn't worth unwinding the read loop for
+            print(f"Dropping short response 0x{resp_word.hex()} ({len(data)} bytes)")
+            return
+        handler(self, data)
+
+    def _on_config_start(self, data: memoryview) -> None:
+        self.config_started = True
+
+    def _on_config_end(self, data: memoryview) -> None:
+        if data[2:4] == STATUS_SUCCESS:
+            self.config_started = False
+
+    def _on_version(self, data: memoryview) -> None:
+        equipment_type = data[2:6]
+        version_type = data[6:8]
+        major, minor, patch = _U_VER.unpack_from(data, 8)
+        self.version = f"{major}.{minor}.{patch}"
+
+    def _on_params(self, data: memoryview) -> None:
+        if data[2:4] == STATUS_SUCCESS:
+            # we expect 6 responses of 4 bytes each; reinterpret the view as
+            # uint32s in place where the host byte order allows it
+            if _LITTLE_ENDIAN:
+                params = data[4:28].cast('I')
+            else:
+                params = _U_PARAMS.unpack_from(data, 4)
+            (
+                self._freq_status,
+                self._freq_distance,
+                self._distance_max,
+                self._distance_min,
+                self._unattended_delay,
+                self._response_speed
+            ) = params
+
+    def _on_serial_number(self, data: memoryview) -> None:
+        if data[2:4] == STATUS_SUCCESS:
+            serial_len = int.from_bytes(data[4:6], 'little')
+            if len(data) < 6 + serial_len:
+                # variable-length part, can't be covered by the dispatch check
+                print("Dropping truncated serial number response")
                 return
+            self.serial_number = bytes(data[6:6+serial_len]).decode('ascii')
+
+    # O(1) dispatch on the two-byte response word. Built once at class
+    # creation, so the keys' hashes are cached for the lookup in parse()
+    _HANDLERS = {
+        Responses.CONFIG_START: _on_config_start,
+        Responses.CONFIG_END:   _on_config_end,
+        Responses.GET_VERSION:  _on_version,
+        Responses.PARAMS_READ:  _on_params,
+        Responses.SERIAL_READ:  _on_serial_number,
+    }
 
 def main(dev: str):
     print(f"Opening {dev}...")
 
-    buf = b''
     with serial.Serial(dev, 115200, timeout=1) as ser:
         sensor = LD2410s(ser)
         while sensor.update():